@@ -4,7 +4,7 @@ import sys
 
 import os
 
-from routes1846 import boardstate, find_best_routes, private_companies, railroads
+from routes1846 import boardstate, find_best_routes, find_best_routes_within, private_companies, railroads, ResultCache
 
 
 def parse_args():
@@ -21,6 +21,11 @@ def parse_args():
             help=("CSV file containing private company info. Semi-colon is the column separator. A column's precise "
                   "meaning depends on the company. The columns are: "
                   "name; owner; coordinate (optional)."))
+    parser.add_argument("-c", "--cache-dir",
+            help="Directory in which to cache results, so repeated runs against the same board state are instant.")
+    parser.add_argument("-t", "--time-limit", type=float,
+            help=("Stop searching after this many seconds, and print the best routes found so far. With a cache "
+                  "directory, only a search which finished in time is cached."))
     parser.add_argument("-v", "--verbose", action="store_true")
     return vars(parser.parse_args())
 
@@ -40,7 +45,15 @@ if __name__ == "__main__":
     if active_railroad.is_removed:
         raise ValueError("Cannot calculate routes for a removed railroad: {}".format(active_railroad.name))
 
-    best_routes = find_best_routes(board, railroads, active_railroad)
+    result_cache = ResultCache(args["cache_dir"]) if args.get("cache_dir") else None
+    if args.get("time_limit") is not None:
+        best_routes, value, upper_bound = find_best_routes_within(board, railroads, active_railroad, args["time_limit"],
+                result_cache=result_cache)
+        if value < upper_bound:
+            print("Ran out of time. These routes are worth {}, but the best could be worth up to {}.".format(value, upper_bound))
+    else:
+        best_routes = find_best_routes(board, railroads, active_railroad, result_cache=result_cache)
+
     print("RESULT")
     for route in best_routes:
         city_path = " -> ".join("{} [{}]".format(city.name, route.city_values[city]) for city in route.visited_cities)
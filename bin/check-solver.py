@@ -0,0 +1,77 @@
+import argparse
+import collections
+import random
+import sys
+
+from routes1846.solver import EncodedRoutes, Problem, SolverPool, search_within
+
+# Just enough of a route for EncodedRoutes.encode()
+SyntheticRoute = collections.namedtuple("SyntheticRoute", ["value", "edges", "cities"])
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+            description=("Checks that a multi-process SolverPool finds route sets as good as a single-process search "
+                         "run to completion, on randomly generated problems."))
+    parser.add_argument("-n", "--problems", type=int, default=8, help="How many problems to generate.")
+    parser.add_argument("-p", "--processes", type=int, default=8, help="How many worker processes the pool runs.")
+    parser.add_argument("-r", "--routes", type=int, default=1500, help="How many routes each train may run.")
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    return vars(parser.parse_args())
+
+def make_problem(rand, route_count):
+    routes_by_train = []
+    for train_index in range(rand.randint(3, 4)):
+        # Sometimes make the train identical to the one before it, which then shares its routes.
+        if routes_by_train and rand.random() < 0.3:
+            routes_by_train.append(routes_by_train[-1])
+            continue
+
+        # Routes share edges often enough that the best ones conflict, and longer routes tend to be worth more, so the
+        # search has to work for its answer and gets split across workers.
+        routes = []
+        for route_index in range(route_count):
+            edge_count = rand.randint(4, 14)
+            edges = 0
+            for edge in rand.sample(range(60), edge_count):
+                edges |= 1 << edge
+            routes.append(SyntheticRoute(10 * edge_count + rand.randint(0, 60), edges, range(rand.randint(2, 8))))
+        routes_by_train.append(EncodedRoutes.encode(sorted(routes, key=lambda route: route.value, reverse=True)))
+
+    return Problem(routes_by_train, rand.random() < 0.5)
+
+def route_set_value(problem, route_indexes):
+    edges = 0
+    for routes, index in zip(problem.routes, route_indexes):
+        route_edges = routes.route(index)[1]
+        if edges & route_edges:
+            raise ValueError("The route set uses an edge twice: {}".format(route_indexes))
+        edges |= route_edges
+
+    values = [routes.values[index] for routes, index in zip(problem.routes, route_indexes)]
+    city_counts = [routes.city_counts[index] for routes, index in zip(problem.routes, route_indexes)]
+    return sum(values) + problem.city_bonus * max(city_counts)
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    rand = random.Random(args["seed"])
+    problems = [make_problem(rand, args["routes"]) for k in range(args["problems"])]
+    with SolverPool(args["processes"]) as solver:
+        solutions = solver.solve(problems)
+
+    failures = 0
+    if [problem_id for problem_id, route_indexes in solutions] != list(range(len(problems))):
+        print("Expected one route set per problem, but got them for problems {}".format(
+                [problem_id for problem_id, route_indexes in solutions]))
+        failures += 1
+
+    for problem_id, route_indexes in solutions:
+        expected_value = search_within(problems[problem_id], float("inf"))[1]
+        value = route_set_value(problems[problem_id], route_indexes)
+        if value != expected_value:
+            print("Problem {}: the pool found a route set worth {}, but the best is worth {}.".format(problem_id, value, expected_value))
+            failures += 1
+
+    print("{} problems checked, {} failures.".format(len(problems), failures))
+    sys.exit(1 if failures else 0)
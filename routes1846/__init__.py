@@ -6,4 +6,8 @@ _DATA_ROOT_DIR = os.path.abspath(os.path.normpath(os.path.join(os.path.dirname(_
 def get_data_file(filename):
     return os.path.join(_DATA_ROOT_DIR, filename)
 
-from routes1846.find_best_routes import find_best_routes, LOG
\ No newline at end of file
+from routes1846.find_best_routes import find_best_routes, find_best_routes_all, find_best_routes_within, BestRoutes, RouteCache, LOG
+from routes1846.resultcache import ResultCache, board_fingerprint
+from routes1846.ilpsolver import IlpSolver
+from routes1846.solver import SolverPool
+from routes1846.replay import GameReplay, replay_actions, replay_snapshots
\ No newline at end of file
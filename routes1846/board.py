@@ -1,3 +1,4 @@
+import collections
 import itertools
 
 from routes1846 import boardtile
@@ -14,6 +15,12 @@ class Board(object):
     def __init__(self, board_tiles):
         self._board_tiles = board_tiles
         self._placed_tiles = {}
+        # Every cell whose tile or stations changed, in order. Its length doubles as a version number.
+        self._changed_cells = []
+        # Each railroad's stations, by cell. Kept up to date by every method which places a tile or station.
+        self._stations_by_railroad = collections.defaultdict(dict)
+        for cell in self._board_tiles:
+            self._index_stations(cell)
 
     def place_tile(self, coord, tile, orientation):
         cell = Cell.from_coord(coord)
@@ -30,9 +37,13 @@ class Board(object):
             self._validate_place_tile_upgrade(old_tile, cell, tile, orientation)
 
             self._placed_tiles[cell] = PlacedTile.place(old_tile.name, cell, tile, orientation, stations=old_tile.stations, port_value=old_tile.port_value, meat_value=old_tile.meat_value)
+            self._keep_tokens(old_tile, self._placed_tiles[cell])
         else:
             self._placed_tiles[cell] = PlacedTile.place(None, cell, tile, orientation)
 
+        self._index_stations(cell)
+        self._changed_cells.append(cell)
+
     def place_station(self, coord, railroad):
         cell = Cell.from_coord(coord)
         if cell == CHICAGO_CELL:
@@ -43,6 +54,8 @@ class Board(object):
             raise ValueError("{} is not a city, so it cannot have a station.".format(cell))
 
         tile.add_station(railroad)
+        self._index_stations(cell)
+        self._changed_cells.append(cell)
 
     def place_chicago(self, tile):
         cell = CHICAGO_CELL
@@ -51,12 +64,17 @@ class Board(object):
             raise ValueError("{}: Going from phase {} to phase {} is not an upgrade.".format(cell, old_tile.phase, tile.phase))
 
         new_tile = Chicago.place(tile, old_tile.exit_cell_to_station, port_value=old_tile.port_value, meat_value=old_tile.meat_value)
+        self._keep_tokens(old_tile, new_tile)
         self._placed_tiles[cell] = new_tile
+        self._index_stations(cell)
+        self._changed_cells.append(cell)
 
     def place_chicago_station(self, railroad, exit_side):
         chicago = self.get_space(CHICAGO_CELL)
         exit_cell = CHICAGO_CELL.neighbors[exit_side]
         chicago.add_station(railroad, exit_cell)
+        self._index_stations(CHICAGO_CELL)
+        self._changed_cells.append(CHICAGO_CELL)
 
     def place_seaport_token(self, coord, railroad):
         if railroad.is_removed:
@@ -82,13 +100,32 @@ class Board(object):
 
         self.get_space(current_cell).place_meat_packing_token(railroad)
 
+    def _keep_tokens(self, old_tile, new_tile):
+        # An upgrade keeps the private company tokens placed on the tile it replaces.
+        new_tile.port_token = old_tile.port_token
+        new_tile.meat_token = old_tile.meat_token
+
+    def _index_stations(self, cell):
+        for stations_by_cell in self._stations_by_railroad.values():
+            stations_by_cell.pop(cell, None)
+
+        tile = self.get_space(cell)
+        if isinstance(tile, (boardtile.City, PlacedTile)):
+            for station in tile.stations:
+                self._stations_by_railroad[station.railroad.name][cell] = station
+
     def stations(self, railroad_name=None):
-        all_tiles = list(self._placed_tiles.values()) + list(self._board_tiles.values())
-        all_stations = itertools.chain.from_iterable([tile.stations for tile in all_tiles if isinstance(tile, (boardtile.City, PlacedTile))])
         if railroad_name:
-            return tuple([station for station in all_stations if station.railroad.name == railroad_name])
+            return tuple(self._stations_by_railroad.get(railroad_name, {}).values())
         else:
-            return tuple(all_stations)
+            return tuple(itertools.chain.from_iterable([stations_by_cell.values() for stations_by_cell in self._stations_by_railroad.values()]))
+
+    @property
+    def version(self):
+        return len(self._changed_cells)
+
+    def changed_cells(self, since_version):
+        return set(self._changed_cells[since_version:])
 
     def get_space(self, cell):
         return self._placed_tiles.get(cell) or self._board_tiles.get(cell)
@@ -3,9 +3,17 @@ import itertools
 CHICAGO_CELL = None  # Defined below
 CHICAGO_CONNECTIONS_CELL = None  # Defined below
 _CELL_DB = {}
+_EDGE_BITS = {}
 
 
 class Cell(object):
+    """
+    A space on the map. There is exactly one Cell per space, so cells compare by identity, and hash by an integer ID
+    assigned once when the map is built. Neighbors are likewise looked up once, as a tuple indexed by side.
+    """
+
+    __slots__ = ("__row", "__col", "id", "neighbors")
+
     @staticmethod
     def from_coord(coord):
         if len(coord) < 2 or len(coord) > 3:
@@ -19,25 +27,29 @@ class Cell(object):
     def __init__(self, row, col):
         self.__row = row
         self.__col = col
-
-    @property
-    def neighbors(self):
-        return {
-            0: _CELL_DB.get(chr(ord(self.__row) + 1), {}).get(self.__col - 1),
-            1: _CELL_DB.get(self.__row, {}).get(self.__col - 2),
-            2: _CELL_DB.get(chr(ord(self.__row) - 1), {}).get(self.__col - 1),
-            3: _CELL_DB.get(chr(ord(self.__row) - 1), {}).get(self.__col + 1),
-            4: _CELL_DB.get(self.__row, {}).get(self.__col + 2),
-            5: _CELL_DB.get(chr(ord(self.__row) + 1), {}).get(self.__col + 1)
-        }
+        # Both are set by _link_cells(), once every cell exists.
+        self.id = None
+        self.neighbors = None
+
+    def _find_neighbors(self):
+        return (
+            _CELL_DB.get(chr(ord(self.__row) + 1), {}).get(self.__col - 1),
+            _CELL_DB.get(self.__row, {}).get(self.__col - 2),
+            _CELL_DB.get(chr(ord(self.__row) - 1), {}).get(self.__col - 1),
+            _CELL_DB.get(chr(ord(self.__row) - 1), {}).get(self.__col + 1),
+            _CELL_DB.get(self.__row, {}).get(self.__col + 2),
+            _CELL_DB.get(chr(ord(self.__row) + 1), {}).get(self.__col + 1)
+        )
+
+    def __reduce__(self):
+        # Unpickling must return the existing cell, not a copy.
+        return (Cell.from_coord, (str(self), ))
 
     def __hash__(self):
-        return hash(str(self))
+        return self.id
 
     def __eq__(self, other):
-        if not isinstance(other, Cell):
-            return False
-        return self.__col == other.__col and self.__row == other.__row
+        return self is other
 
     def __gt__(self, other):
         if self.__row == other.__row:
@@ -77,10 +89,39 @@ _CELL_DB = {
     "K": {3: Cell("K", 3)}
 }
 
+def _link_cells():
+    for cell_id, cell in enumerate(board_cells()):
+        cell.id = cell_id
+        cell.neighbors = cell._find_neighbors()
+
 CHICAGO_CELL = Cell.from_coord("D6")
 CHICAGO_CONNECTIONS_CELL = Cell.from_coord("C5")
 
 def board_cells():
     for row, columns in _CELL_DB.items():
         for column, cell in columns.items():
-            yield cell
\ No newline at end of file
+            yield cell
+
+def _number_edges():
+    # The map never changes, so each pair of neighboring cells gets the same bit on every board.
+    edge_bits = {}
+    for cell in board_cells():
+        for neighbor in cell.neighbors:
+            if neighbor and (neighbor, cell) not in edge_bits:
+                edge_bits[(cell, neighbor)] = edge_bits[(neighbor, cell)] = 1 << (len(edge_bits) // 2)
+    return edge_bits
+
+_link_cells()
+_EDGE_BITS = _number_edges()
+
+def edge_bit(cell, neighbor):
+    return _EDGE_BITS[(cell, neighbor)]
+
+def split_edges(edges):
+    """
+    Yields each edge bit set in an edge bitmask.
+    """
+    while edges:
+        low_bit = edges & -edges
+        yield low_bit
+        edges ^= low_bit
@@ -0,0 +1,174 @@
+from routes1846.cell import CHICAGO_CELL, board_cells
+
+# Each cell gets one slot per side it can be entered from, plus one for starting a route on it.
+NO_ENTRY = 6
+_SLOTS = 7
+
+
+def _opposite(side):
+    return (side + 3) % 6
+
+def _side_of(tile):
+    return {neighbor: side for side, neighbor in enumerate(tile.cell.neighbors) if neighbor}
+
+def _entries(tile):
+    """
+    Returns (entry slot, cell entered from) for each way into the tile, starting with (NO_ENTRY, None).
+    """
+    side_of = _side_of(tile)
+    return [(NO_ENTRY, None)] + [(side_of[enter_from], enter_from) for enter_from in tile.paths()]
+
+def _compile_exits(board, tile, railroad, exits):
+    side_of = _side_of(tile)
+    for slot, enter_from in _entries(tile):
+        slot_exits = []
+        for exit_cell in tile.paths(enter_from, railroad):
+            neighbor = board.get_space(exit_cell)
+            # Only keep exits that lead into a tile with a path back to this cell.
+            if neighbor and tile.cell in neighbor.paths():
+                slot_exits.append((exit_cell.id, _opposite(side_of[exit_cell])))
+        exits[tile.cell.id * _SLOTS + slot] = tuple(slot_exits)
+
+
+class CompiledBoard(object):
+    """
+    A frozen, integer-indexed view of a fully loaded board, from the point of view of a single railroad.
+
+    Cells are identified by Cell.id, and everything the path search needs is stored in flat lists indexed either by
+    cell ID, or by (cell ID * 7 + entry slot), where the entry slot is the side the cell was entered from, or NO_ENTRY
+    for the first cell of a route. Exits are stored as (neighbor cell ID, neighbor entry slot) pairs, so walking an exit
+    never needs to touch a Cell or a tile.
+    """
+
+    @staticmethod
+    def compile(board, railroad):
+        return CompiledBoard.compile_topology(board).for_railroad(board, railroad)
+
+    @staticmethod
+    def compile_topology(board):
+        """
+        Compiles the parts of the board which are the same for every railroad. The result belongs to no railroad, so
+        it can't be searched. Call for_railroad() for each railroad instead, which is much cheaper than compiling the
+        board again.
+        """
+        # Cell IDs are the cells' own IDs, so spaces without a tile are left as None.
+        tiles = [None] * len(list(board_cells()))
+        for cell in board_cells():
+            tiles[cell.id] = board.get_space(cell)
+
+        is_city = bytearray(len(tiles))
+        exits = [()] * (len(tiles) * _SLOTS)
+        for cell_id, tile in enumerate(tiles):
+            if tile:
+                is_city[cell_id] = tile.is_city
+                _compile_exits(board, tile, None, exits)
+
+        return CompiledBoard(None, tiles, is_city, bytearray(len(tiles) * _SLOTS), exits)
+
+    def for_railroad(self, board, railroad):
+        """
+        Returns a copy of this board for railroad. Only city passability and Chicago's exits depend on the railroad,
+        so only they are compiled again. Everything else is shared.
+        """
+        if railroad.is_removed:
+            raise ValueError("A removed railroad cannot run routes: {}".format(railroad.name))
+
+        passable = bytearray(len(self.passable))
+        for tile in self.tiles:
+            if tile and tile.is_city:
+                for slot, enter_from in _entries(tile)[1:]:
+                    passable[tile.cell.id * _SLOTS + slot] = tile.passable(enter_from, railroad)
+
+        exits = self.exits
+        chicago = self.tiles[CHICAGO_CELL.id]
+        if chicago:
+            exits = list(exits)
+            _compile_exits(board, chicago, railroad, exits)
+
+        return CompiledBoard(railroad, self.tiles, self.is_city, passable, exits)
+
+    def __init__(self, railroad, tiles, is_city, passable, exits):
+        self.railroad = railroad
+        self.tiles = tiles
+        self.is_city = is_city
+        self.passable = passable
+        self.exits = exits
+
+    def cell_id(self, cell):
+        return cell.id if self.tiles[cell.id] else None
+
+    def get_exits(self, cell_id, slot):
+        return self.exits[cell_id * _SLOTS + slot]
+
+    def is_passable(self, cell_id, slot):
+        return slot == NO_ENTRY or not self.is_city[cell_id] or bool(self.passable[cell_id * _SLOTS + slot])
+
+    def walk(self, start_id, length):
+        """
+        Yields every path (as a tuple of cell IDs) which starts at start_id, ends in a different city, and visits at
+        most length cities. Every city in the middle of a path must be passable.
+        """
+        visited = bytearray(len(self.tiles))
+        visited[start_id] = 1
+        return self._extend([start_id], visited, self.get_exits(start_id, NO_ENTRY), length - self.is_city[start_id])
+
+    def routes_through(self, anchor_id, length):
+        """
+        Yields every path (as a tuple of cell IDs) which passes through anchor_id, starts and ends in a city, and visits
+        at most length cities. Each path is yielded in only one direction.
+
+        Paths are built outward from the anchor. Each path leaving the anchor is used as the left half of a route, and
+        is then extended to the right from the anchor, without revisiting any of its cells.
+        """
+        is_city = self.is_city
+        anchor_slots = {neighbor_id: _opposite(neighbor_slot) for neighbor_id, neighbor_slot in self.get_exits(anchor_id, NO_ENTRY)}
+
+        visited = bytearray(len(self.tiles))
+        for left in self.walk(anchor_id, length):
+            if is_city[anchor_id]:
+                yield left
+
+            left_cities = sum([is_city[cell_id] for cell_id in left])
+            slot = anchor_slots[left[1]]
+            if left_cities >= length or not self.is_passable(anchor_id, slot):
+                continue
+
+            # Only extend towards neighbors numbered above the left half's first step, so each route is only built
+            # from one of its ends.
+            right_exits = tuple([exit for exit in self.get_exits(anchor_id, slot) if exit[0] > left[1]])
+            if right_exits:
+                for cell_id in left:
+                    visited[cell_id] = 1
+                yield from self._extend(list(reversed(left)), visited, right_exits, length - left_cities)
+                for cell_id in left:
+                    visited[cell_id] = 0
+
+    def _extend(self, path, visited, exits, remaining):
+        is_city = self.is_city
+        # Each frame is [exits, next exit index, remaining cities], and matches the cell at the same depth in path.
+        stack = [[exits, 0, remaining]]
+        while stack:
+            frame = stack[-1]
+            if frame[1] == len(frame[0]):
+                stack.pop()
+                if stack:
+                    visited[path.pop()] = 0
+                continue
+
+            cell_id, slot = frame[0][frame[1]]
+            frame[1] += 1
+            if visited[cell_id]:
+                continue
+
+            remaining = frame[2]
+            path.append(cell_id)
+            if is_city[cell_id]:
+                yield tuple(path)
+
+                if remaining <= 1 or not self.is_passable(cell_id, slot):
+                    path.pop()
+                    continue
+                remaining -= 1
+
+            visited[cell_id] = 1
+            stack.append([self.get_exits(cell_id, slot), 0, remaining])
@@ -1,168 +1,114 @@
-import functools
+import collections
 import itertools
 import logging
-import math
-import multiprocessing
-import os
-import queue
+import time
 
 from routes1846.board import Board
 from routes1846.boardtile import EastTerminalCity
-from routes1846.route import Route
-from routes1846.cell import CHICAGO_CELL, CHICAGO_CONNECTIONS_CELL
+from routes1846.compiledboard import CompiledBoard
+from routes1846.railroads import detect_phase
+from routes1846.route import MAIL_CONTRACT_CITY_BONUS, Route, RouteValuation
+from routes1846.solver import Problem, SolverPool, encode_routes, search_within
+from routes1846.cell import CHICAGO_CELL, CHICAGO_CONNECTIONS_CELL, edge_bit, split_edges
 
 LOG = logging.getLogger(__name__)
 
+BestRoutes = collections.namedtuple("BestRoutes", ["routes", "value", "upper_bound"])
+
 
 def route_set_value(route_set):
     return sum(route.value for route in route_set)
 
-def _is_overlapping(active_route, routes_to_check):
-    return any(True for route in routes_to_check if active_route.overlap(route)) if routes_to_check else False
-
-def _find_best_sub_route_set(global_best_value, sorted_routes, selected_routes=None):
-    selected_routes = selected_routes or []
-
-    minor_routes = []
-    best_route_set = selected_routes
-    best_route_set_value = route_set_value(selected_routes)
-    if best_route_set_value > global_best_value.value:
-        global_best_value.value = best_route_set_value
-
-    for minor_route in sorted_routes[0]:
-        if not _is_overlapping(minor_route, selected_routes):
-            if sorted_routes[1:]:
-                # Already selected routes + the current route + the maximum possible value of the remaining train routes.
-                max_possible_route_set = selected_routes + [minor_route] + [routes[0] for routes in sorted_routes[1:]]
-                max_possible_value = route_set_value(max_possible_route_set)
-                # That must be more than the current best route set value, or we bail from this iteration.
-                if max_possible_value <= global_best_value.value:
-                    return best_route_set
-
-                sub_route_set = _find_best_sub_route_set(global_best_value, sorted_routes[1:], selected_routes + [minor_route])
-                sub_route_set_value = route_set_value(sub_route_set)
-                if sub_route_set_value >= global_best_value.value:
-                    best_route_set = sub_route_set
-                    best_route_set_value = sub_route_set_value
-                    global_best_value.value = sub_route_set_value
-            else:
-                return selected_routes + [minor_route]
-    return best_route_set
-
-def _find_best_sub_route_set_worker(input_queue, global_best_value):
-    best_route_sets = []
-    while True:
-        try:
-            sorted_routes = input_queue.get_nowait()
-            best_route_set = _find_best_sub_route_set(global_best_value, sorted_routes)
-
-            if best_route_set:
-                best_route_sets.append(best_route_set)
-        except queue.Empty:
-            return best_route_sets
-
-def _get_train_sets(railroad):
-    train_sets = []
-    for train_count in range(1, len(railroad.trains) + 1):
-        train_combinations = set(itertools.combinations(railroad.trains, train_count))
-        train_sets += [tuple(sorted(train_set, key=lambda train: train.collect)) for train_set in train_combinations]
-    return train_sets
-
-
-def chunk_sequence(sequence, chunk_length):
-    """Yield successive n-sized chunks from l."""
-    for index in range(0, len(sequence), chunk_length):
-        yield sequence[index:index + chunk_length]
-
-
-def _get_route_sets(railroad, route_by_train):
-    manager = multiprocessing.Manager()
-    input_queue = manager.Queue()
-
+def _get_problem(railroad, route_by_train):
+    """
+    Returns the railroad's trains, each train's routes sorted by value, and the Problem to search for their best route
+    set. Each train may also run nothing, so a single search covers every subset of the trains.
+    """
     sorted_routes_by_train = {train: sorted(routes, key=lambda route: route.value, reverse=True) for train, routes in route_by_train.items()}
+    encoded_routes_by_train = {train: encode_routes(routes) for train, routes in sorted_routes_by_train.items()}
 
-    proc_count = os.cpu_count()
-    best_route_sets = []
-    with multiprocessing.Pool(processes=proc_count) as pool:
-        # Using half the processes as workers seems to result in faster processing times.
-        worker_count = proc_count / 2
-        for train_set in _get_train_sets(railroad):
-            sorted_routes = [sorted_routes_by_train[train] for train in train_set]
-
-            if all(sorted_routes):
-                # Cut routes into 1 chunk per worker and put it on the queue
-                chunk_size = math.ceil(len(sorted_routes[0]) / worker_count)
-                for root_routes in chunk_sequence(sorted_routes[0], chunk_size):
-                    input_queue.put_nowait([root_routes] + sorted_routes[1:])
-    
-                # Allow the workers to compare notes on what the best route value is
-                global_best_value = manager.Value('i', 0)
-    
-                # Give each worker the input queue and the best value reference
-                worker_promises = []
-                for k in range(math.ceil(worker_count)):
-                    promise = pool.apply_async(_find_best_sub_route_set_worker, (input_queue, global_best_value))
-                    worker_promises.append(promise)
-        
-                # Add the results to the list
-                for promise in worker_promises:
-                    values = promise.get()
-                    best_route_sets.extend(values)
-
-    return best_route_sets
-
-def _find_best_routes_by_train(route_by_train, railroad):
-    route_sets = _get_route_sets(railroad, route_by_train)
-
-    if railroad.has_mail_contract:
-        for route_set in route_sets:
-            route = max(route_set, key=lambda run_route: len(run_route.cities))
-            route.add_mail_contract()
+    # Identical trains are kept next to each other, so the search can tell them apart from the rest.
+    trains = sorted(railroad.trains, key=lambda train: (train.collect, train.visit))
+    problem = Problem([encoded_routes_by_train[train] for train in trains], railroad.has_mail_contract)
+    return trains, sorted_routes_by_train, problem
 
-    LOG.debug("Found %d route sets.", len(route_sets))
-    for route_set in route_sets:
-        for run_route in route_set:
-            LOG.debug("{}: {} ({})".format(run_route.train, str(run_route), run_route.value))
-        LOG.debug("")
+def _to_route_set(trains, sorted_routes_by_train, route_indexes):
+    # Trains running the null route are left out.
+    return [sorted_routes_by_train[train][index] for train, index in zip(trains, route_indexes)
+            if index < len(sorted_routes_by_train[train])]
 
-    return max(route_sets, key=lambda route_set: sum(route.value for route in route_set)) if route_sets else {}
+def _get_route_set(railroad, route_by_train, solver):
+    if not railroad.trains:
+        return []
 
-def _get_subroutes(routes, stations):
-    subroutes = [route.subroutes(station.cell) for station in stations for route in routes]
-    return set(itertools.chain.from_iterable([subroute for subroute in subroutes if subroute]))
+    trains, sorted_routes_by_train, problem = _get_problem(railroad, route_by_train)
+    route_sets = [_to_route_set(trains, sorted_routes_by_train, route_indexes) for problem_id, route_indexes in solver.solve([problem])]
+    return max(route_sets, key=lambda route_set: _route_set_value_with_bonus(railroad, route_set), default=[])
 
-def _find_connected_cities(board, railroad, cell, dist):
-    tiles = itertools.chain.from_iterable(_walk_routes(board, railroad, None, cell, dist))
-    return {tile.cell for tile in tiles if tile.is_city} - {cell}
+def _route_set_value_with_bonus(railroad, route_set):
+    # The Mail Contract bonus isn't added to the routes until the route set is chosen, so it's counted here.
+    if not railroad.has_mail_contract or not route_set:
+        return route_set_value(route_set)
+    return route_set_value(route_set) + MAIL_CONTRACT_CITY_BONUS * len(_mail_contract_route(route_set).cities)
 
-def _walk_routes(board, railroad, enter_from, cell, length, visited=None):
-    visited = visited or []
-
-    tile = board.get_space(cell)
-    if not tile or (enter_from and enter_from not in tile.paths()) or tile in visited:
-        return (Route.empty(), )
-
-    if tile.is_city:
-        if length - 1 == 0 or (enter_from and not tile.passable(enter_from, railroad)):
-            LOG.debug("- %s", ", ".join([str(tile.cell) for tile in visited + [tile]]))
-            return (Route.single(tile), )
-
-        remaining_cities = length - 1
-    else:
-        remaining_cities = length
+def _remove_dominated_routes(routes, railroad):
+    """
+    Returns the routes not dominated by another route. A route is dominated when another route is worth at least as
+    much while only using edges it also uses, since swapping in the other route can never make a route set worse. With
+    the Mail Contract, the other route must also be worth at least as much once the bonus for its cities is included,
+    in case the dominated route was the one carrying the bonus.
+    """
+    city_bonus = MAIL_CONTRACT_CITY_BONUS if railroad.has_mail_contract else 0
+    # Kept routes are indexed by their lowest edge bit. Any route using a subset of a route's edges has its lowest edge
+    # among that route's edges, so only those buckets need checking. A subset also never uses more edges, so visiting
+    # routes in order of edge count means every possible dominating route has already been seen.
+    kept_by_low_edge = collections.defaultdict(list)
+    kept_routes = []
+    for route in sorted(routes, key=lambda route: (bin(route.edges).count("1"), -route.value, -len(route.cities))):
+        for edge in split_edges(route.edges):
+            if any(not other.edges & ~route.edges and other.value >= route.value and
+                    other.value + city_bonus * len(other.cities) >= route.value + city_bonus * len(route.cities)
+                    for other in kept_by_low_edge[edge]):
+                break
+        else:
+            kept_routes.append(route)
+            kept_by_low_edge[route.edges & -route.edges].append(route)
+
+    return kept_routes
+
+def _remove_all_dominated_routes(route_by_train, railroad):
+    route_by_train = {train: _remove_dominated_routes(routes, railroad) for train, routes in route_by_train.items()}
+    LOG.debug("Kept %d routes after removing dominated routes.", sum(len(routes) for routes in route_by_train.values()))
+    return route_by_train
+
+def _mail_contract_route(route_set):
+    return max(route_set, key=lambda run_route: len(run_route.cities))
+
+def _find_best_routes_by_train(route_by_train, railroad, solver):
+    """
+    The solver does the route set search. Any object with the same solve() method as SolverPool (the default search)
+    or IlpSolver will do.
+    """
+    route_set = _get_route_set(railroad, _remove_all_dominated_routes(route_by_train, railroad), solver)
+    return _finish_route_set(railroad, route_set)
 
-    neighbors = tile.paths(enter_from, railroad)
+def _finish_route_set(railroad, route_set):
+    LOG.debug("Found the best route set for %s.", railroad.name)
+    for run_route in route_set:
+        LOG.debug("{}: {} ({})".format(run_route.train, str(run_route), run_route.value))
 
-    routes = []
-    for neighbor in neighbors:
-        neighbor_paths = _walk_routes(board, railroad, cell, neighbor, remaining_cities, visited + [tile])
-        routes += [Route.single(tile).merge(neighbor_path) for neighbor_path in neighbor_paths if neighbor_path]
+    if not route_set:
+        return {}
 
-    if not routes and tile.is_city:
-        LOG.debug("- %s", ", ".join([str(tile.cell) for tile in visited + [tile]]))
-        routes.append(Route.single(tile))
+    if railroad.has_mail_contract:
+        _mail_contract_route(route_set).add_mail_contract()
+    return route_set
 
-    return tuple(set(routes))
+def _to_route(compiled, path):
+    tiles = [compiled.tiles[cell_id] for cell_id in path]
+    if LOG.isEnabledFor(logging.DEBUG):
+        LOG.debug("- %s", ", ".join([str(tile.cell) for tile in tiles]))
+    return Route.create(tiles)
 
 
 def _filter_invalid_routes(routes, board, railroad):
@@ -178,7 +124,7 @@ def _filter_invalid_routes(routes, board, railroad):
     """
     chicago_space = board.get_space(CHICAGO_CELL)
 
-    chicago_neighbor_cells = [cell for cell in CHICAGO_CELL.neighbors.values() if cell != CHICAGO_CONNECTIONS_CELL]
+    chicago_neighbor_cells = [cell for cell in CHICAGO_CELL.neighbors if cell != CHICAGO_CONNECTIONS_CELL]
     stations = board.stations(railroad.name)
 
     # A sieve style filter. If a condition isn't met, iteration continues to the next item. Items meeting all conditions
@@ -212,83 +158,261 @@ def _filter_invalid_routes(routes, board, railroad):
         # If the only station is Chicago, the path must be [D6, C5], or exit through the appropriate side.
         elif [CHICAGO_CELL] == [station.cell for station in stations_on_route]:
             exit_cell = board.get_space(CHICAGO_CELL).get_station_exit_cell(stations_on_route[0])
-            chicago_exit_route = Route.create([chicago_space, board.get_space(exit_cell)])
-            if not (len(route) == 2 and route.contains_cell(CHICAGO_CONNECTIONS_CELL)) and not route.overlap(chicago_exit_route):
+            uses_chicago_exit = route.edges & edge_bit(CHICAGO_CELL, exit_cell)
+            if not (len(route) == 2 and route.contains_cell(CHICAGO_CONNECTIONS_CELL)) and not uses_chicago_exit:
                 continue
 
         valid_routes.add(route)
 
     return valid_routes
 
-def _find_routes_from_cell(board, railroad, cell, train):
-    tile = board.get_space(cell)
-    if not tile.is_city:
-        raise Exception("How is your station not in a city? {}".format(cell))
+def _find_routes_through_station(compiled, station, visit):
+    cell_id = compiled.cell_id(station.cell)
+    if cell_id is None or not compiled.is_city[cell_id]:
+        raise Exception("How is your station not in a city? {}".format(station.cell))
 
-    routes = _walk_routes(board, railroad, None, cell, train.visit)
+    # Paths which cover the same cells along different edges, or end on different cells, are different routes, so
+    # the set only drops a path which is the same route as one already found.
+    routes = {_to_route(compiled, path) for path in compiled.routes_through(cell_id, visit)}
 
-    LOG.debug("Found %d routes starting at %s.", len(routes), cell)
+    LOG.debug("Found %d routes through %s.", len(routes), station.cell)
     return routes
 
-def _find_connected_routes(board, railroad, station, train):
-    LOG.debug("Finding connected cities.")
-    connected_cities = _find_connected_cities(board, railroad, station.cell, train.visit - 1)
-    LOG.debug("Connected cities: %s", ", ".join([str(cell) for cell in connected_cities]))
+def _index_routes_by_visit(routes):
+    """
+    Groups routes by the minimum visit length a train needs to run them, which is the number of cities on the route.
+    """
+    routes_by_visit = collections.defaultdict(set)
+    for route in routes:
+        routes_by_visit[len(route.cities)].add(route)
+    return routes_by_visit
 
-    LOG.debug("Finding routes starting from connected cities.")
-    connected_routes = set()
-    for cell in connected_cities:
-        connected_routes.update(_find_routes_from_cell(board, railroad, cell, train))
-    LOG.debug("Found %d routes from connected cities.", len(connected_routes))
-    return connected_routes
+def _max_visit(railroad):
+    return max([train.visit for train in railroad.trains], default=0)
 
-def _find_all_routes(board, railroad):
-    LOG.info("Finding all possible routes for each train from %s's stations.", railroad.name)
+def _find_valid_routes(board, railroad, compiled, max_visit):
+    routes = set()
+    for station in board.stations(railroad.name):
+        LOG.debug("Finding routes which start at or pass through station at %s.", station.cell)
+        routes.update(_find_routes_through_station(compiled, station, max_visit))
 
-    stations = board.stations(railroad.name)
+    LOG.debug("Filtering out invalid routes")
+    return _filter_invalid_routes(routes, board, railroad)
+
+def _get_routes_by_train(railroad, routes):
+    routes_by_visit = _index_routes_by_visit(routes)
 
     routes_by_train = {}
     for train in railroad.trains:
         if train not in routes_by_train:
-            routes = set()
-            for station in stations:
-                LOG.debug("Finding routes starting at station at %s.", station.cell)
-                routes.update(_find_routes_from_cell(board, railroad, station.cell, train))
+            routes_by_train[train] = set(itertools.chain.from_iterable(
+                    [routes for visit, routes in routes_by_visit.items() if visit <= train.visit]))
+
+    LOG.info("Found %d routes.", sum(len(route) for route in routes_by_train.values()))
+    if LOG.isEnabledFor(logging.DEBUG):
+        for train, routes in routes_by_train.items():
+            for route in routes:
+                LOG.debug("{}: {}".format(train, str(route)))
 
-                LOG.debug("Finding routes which pass through station at %s.", station.cell)
-                connected_paths = _find_connected_routes(board, railroad, station, train)
-                routes.update(connected_paths)
+    return routes_by_train
 
-            LOG.debug("Add subroutes")
-            routes.update(_get_subroutes(routes, stations))
+def _compile(board, railroad, topology=None):
+    if topology:
+        return topology.for_railroad(board, railroad)
+    else:
+        return CompiledBoard.compile(board, railroad)
 
-            LOG.debug("Filtering out invalid routes")
-            routes_by_train[train] = _filter_invalid_routes(routes, board, railroad)
+def _find_all_routes(board, railroad, topology=None):
+    LOG.info("Finding all possible routes for each train from %s's stations.", railroad.name)
 
-    LOG.info("Found %d routes.", sum(len(route) for route in routes_by_train.values()))
-    for train, routes in routes_by_train.items():
+    compiled = _compile(board, railroad, topology)
+
+    # A single walk for the longest train also finds every shorter route, so each train just takes the routes it's
+    # long enough to run.
+    routes = _find_valid_routes(board, railroad, compiled, _max_visit(railroad))
+
+    return _get_routes_by_train(railroad, routes)
+
+class _CachedRoutes(object):
+    def __init__(self, board, max_visit, routes):
+        self.board = board
+        self.version = board.version
+        self.max_visit = max_visit
+        self.routes = set()
+        self.routes_by_cell = collections.defaultdict(set)
+
+        self.add(routes)
+
+    def add(self, routes):
         for route in routes:
-            LOG.debug("{}: {}".format(train, str(route)))
+            self.routes.add(route)
+            for tile in route:
+                self.routes_by_cell[tile.cell].add(route)
+
+    def remove_touching(self, cells):
+        stale_routes = set(itertools.chain.from_iterable([self.routes_by_cell.pop(cell, ()) for cell in cells]))
+        for route in stale_routes:
+            self.routes.discard(route)
+            for tile in route:
+                self.routes_by_cell[tile.cell].discard(route)
+
+class RouteCache(object):
+    """
+    Keeps each railroad's valid routes between calls to find_best_routes() on the same Board. When the board changes,
+    only the routes touching a changed cell are thrown out, and only routes through a changed cell are searched for.
+    A compiled topology of the board (from CompiledBoard.compile_topology()) may be passed in to save compiling it.
+    """
 
-    return routes_by_train
+    def __init__(self):
+        self._cached_routes = {}
+
+    def find_all_routes(self, board, railroad, topology=None):
+        LOG.info("Finding all possible routes for each train from %s's stations.", railroad.name)
+
+        max_visit = _max_visit(railroad)
+        cached_routes = self._cached_routes.get(railroad.name)
+        changed_cells = board.changed_cells(cached_routes.version) if cached_routes else set()
+
+        # Starting a route in Chicago is restricted to the station's exit, so the routes through it can't be found by
+        # searching outward from Chicago alone.
+        if not cached_routes or cached_routes.board is not board or cached_routes.max_visit < max_visit or \
+                CHICAGO_CELL in changed_cells:
+            LOG.debug("Finding all routes from scratch.")
+            compiled = _compile(board, railroad, topology)
+            cached_routes = _CachedRoutes(board, max_visit, _find_valid_routes(board, railroad, compiled, max_visit))
+            self._cached_routes[railroad.name] = cached_routes
+        elif changed_cells:
+            LOG.debug("Updating routes touching %s.", ", ".join([str(cell) for cell in sorted(changed_cells)]))
+            cached_routes.remove_touching(changed_cells)
+            cached_routes.add(self._find_routes_through_cells(board, railroad, changed_cells, cached_routes.max_visit, topology))
+            cached_routes.version = board.version
+
+        return _get_routes_by_train(railroad, cached_routes.routes)
+
+    def _find_routes_through_cells(self, board, railroad, cells, max_visit, topology):
+        compiled = _compile(board, railroad, topology)
+        station_cells = {station.cell for station in board.stations(railroad.name)}
+
+        routes = set()
+        for cell in cells:
+            cell_id = compiled.cell_id(cell)
+            if cell_id is not None:
+                for path in compiled.routes_through(cell_id, max_visit):
+                    if any(compiled.tiles[path_id].cell in station_cells for path_id in path):
+                        routes.add(_to_route(compiled, path))
+
+        return _filter_invalid_routes(routes, board, railroad)
+
+def _find_route_values(board, railroad, phase, route_cache, topology=None):
+    if route_cache:
+        routes = route_cache.find_all_routes(board, railroad, topology)
+    else:
+        routes = _find_all_routes(board, railroad, topology)
 
-def _detect_phase(railroads):
-    all_train_phases = [train.phase for railroad in railroads.values() for train in railroad.trains]
-    return max(all_train_phases) if all_train_phases else 1
+    LOG.info("Calculating route values.")
+    valuation = RouteValuation(board, railroad, phase)
+    route_value_by_train = {}
+    for train in routes:
+        route_value_by_train[train] = [route.run(board, train, railroad, phase, valuation) for route in routes[train]]
+    return route_value_by_train
 
-def find_best_routes(board, railroads, active_railroad):
+def find_best_routes(board, railroads, active_railroad, route_cache=None, result_cache=None, solver=None):
     if active_railroad.is_removed:
         raise ValueError("Cannot calculate routes for a removed railroad: {}".format(active_railroad.name))
 
+    if result_cache:
+        best_routes = result_cache.get(board, railroads, active_railroad)
+        if best_routes is not None:
+            return best_routes
+
     LOG.info("Finding the best route for %s.", active_railroad.name)
 
-    routes = _find_all_routes(board, active_railroad)
+    route_value_by_train = _find_route_values(board, active_railroad, detect_phase(railroads), route_cache)
 
-    phase = _detect_phase(railroads)
+    if solver:
+        best_routes = _find_best_routes_by_train(route_value_by_train, active_railroad, solver)
+    else:
+        with SolverPool() as solver:
+            best_routes = _find_best_routes_by_train(route_value_by_train, active_railroad, solver)
 
-    LOG.info("Calculating route values.")
-    route_value_by_train = {}
-    for train in routes:
-        route_value_by_train[train] = [route.run(board, train, active_railroad, phase) for route in routes[train]]
+    if result_cache:
+        result_cache.put(board, railroads, active_railroad, best_routes)
+
+    return best_routes
 
-    return _find_best_routes_by_train(route_value_by_train, active_railroad)
+def find_best_routes_within(board, railroads, active_railroad, time_limit, route_cache=None, result_cache=None):
+    """
+    Like find_best_routes(), but gives up after time_limit seconds, returning the best route set found so far. Runs in
+    this process. Returns a BestRoutes, whose upper_bound is the most any route set could be worth. If it equals value,
+    the route set is the best one.
+
+    A result_cache only ever holds best route sets, so a route set is only put in it if the search finished.
+    """
+    if active_railroad.is_removed:
+        raise ValueError("Cannot calculate routes for a removed railroad: {}".format(active_railroad.name))
+
+    if result_cache:
+        best_routes = result_cache.get(board, railroads, active_railroad)
+        if best_routes is not None:
+            value = route_set_value(best_routes)
+            return BestRoutes(best_routes, value, value)
+
+    deadline = time.time() + time_limit
+
+    LOG.info("Finding the best route for %s within %s seconds.", active_railroad.name, time_limit)
+
+    route_value_by_train = _find_route_values(board, active_railroad, detect_phase(railroads), route_cache)
+    if not active_railroad.trains:
+        return BestRoutes([], 0, 0)
+
+    route_by_train = _remove_all_dominated_routes(route_value_by_train, active_railroad)
+    trains, sorted_routes_by_train, problem = _get_problem(active_railroad, route_by_train)
+    route_indexes, value, upper_bound = search_within(problem, deadline)
+
+    route_set = _to_route_set(trains, sorted_routes_by_train, route_indexes)
+    if active_railroad.has_mail_contract and route_set:
+        _mail_contract_route(route_set).add_mail_contract()
+
+    if result_cache and value == upper_bound:
+        result_cache.put(board, railroads, active_railroad, route_set)
+
+    return BestRoutes(route_set, value, upper_bound)
+
+def find_best_routes_all(board, railroads, route_cache=None, solver=None):
+    """
+    Finds the best routes for every railroad which hasn't been removed. The board is compiled once for all of them,
+    and their searches all go to the solver together. Returns a dict of railroad name to the route set
+    find_best_routes() would return for it.
+    """
+    active_railroads = [railroad for name, railroad in sorted(railroads.items()) if not railroad.is_removed]
+    phase = detect_phase(railroads)
+    topology = CompiledBoard.compile_topology(board)
+
+    LOG.info("Finding the best routes for %s.", ", ".join([railroad.name for railroad in active_railroads]))
+
+    searches, problems = [], []
+    for railroad in active_railroads:
+        route_value_by_train = _find_route_values(board, railroad, phase, route_cache, topology)
+        if railroad.trains:
+            trains, sorted_routes_by_train, problem = _get_problem(railroad, _remove_all_dominated_routes(route_value_by_train, railroad))
+            searches.append((railroad, trains, sorted_routes_by_train))
+            problems.append(problem)
+
+    if not problems:
+        solutions = []
+    elif solver:
+        solutions = solver.solve(problems)
+    else:
+        with SolverPool() as solver:
+            solutions = solver.solve(problems)
+
+    # Keep the best route set reported for each railroad, in case the solver reports more than one.
+    route_sets = {railroad.name: [] for railroad in active_railroads}
+    for problem_id, route_indexes in solutions:
+        railroad, trains, sorted_routes_by_train = searches[problem_id]
+        route_set = _to_route_set(trains, sorted_routes_by_train, route_indexes)
+        best_route_set = route_sets[railroad.name]
+        if _route_set_value_with_bonus(railroad, route_set) > _route_set_value_with_bonus(railroad, best_route_set):
+            route_sets[railroad.name] = route_set
+
+    return {railroad.name: _finish_route_set(railroad, route_sets[railroad.name]) for railroad in active_railroads}
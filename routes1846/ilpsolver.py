@@ -0,0 +1,116 @@
+import collections
+import logging
+
+try:
+    import pulp
+except ImportError:
+    pulp = None
+
+from routes1846.cell import split_edges
+from routes1846.solver import _CITIES, _EDGES, _VALUE, decode_problem
+
+LOG = logging.getLogger(__name__)
+
+
+def _route_index(train_vars):
+    return pulp.lpSum([index * route_var for index, route_var in enumerate(train_vars)])
+
+
+class IlpSolver(object):
+    """
+    Finds the best route set for each problem by solving it as a 0/1 integer program, using pulp and its bundled CBC
+    solver. There is one variable per (train, route). Each train must run exactly one route, and no two routes may
+    share an edge. The objective is the total value of the selected routes, plus the Mail Contract bonus if the railroad
+    has it.
+
+    Unlike the SolverPool's search, the result is a proven optimum (unless time_limit cuts a solve short), and its run
+    time depends on the size of the program, rather than on how well the search happens to prune.
+
+    Requires pulp, which can be installed with the "ilp" extra.
+    """
+
+    def __init__(self, time_limit=None):
+        if pulp is None:
+            raise ImportError("IlpSolver requires pulp. Install it with: pip install routes-1846[ilp]")
+
+        self.time_limit = time_limit
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def solve(self, problems):
+        """
+        Given a list of Problems, returns a list of (problem index, [route index per train]), with the best route set
+        for each problem which has any routes. If time_limit runs out before any route set is found, every train runs
+        the null route, and a warning is logged.
+        """
+        best_route_sets = []
+        for problem_id, problem in enumerate(problems):
+            if problem.routes:
+                best_route_sets.append((problem_id, self._solve_problem(decode_problem(problem), problem.city_bonus)))
+        return best_route_sets
+
+    def _solve_problem(self, sorted_routes, city_bonus):
+        program = pulp.LpProblem("route_set", pulp.LpMaximize)
+
+        route_vars = []
+        vars_by_edge = collections.defaultdict(list)
+        for train_index, routes in enumerate(sorted_routes):
+            train_vars = []
+            for route_index, route in enumerate(routes):
+                route_var = pulp.LpVariable("x_{}_{}".format(train_index, route_index), cat=pulp.LpBinary)
+                train_vars.append(route_var)
+                for edge in split_edges(route[_EDGES]):
+                    vars_by_edge[edge].append((train_index, route_var))
+            route_vars.append(train_vars)
+
+            program += pulp.lpSum(train_vars) == 1
+
+            # Identical trains share a route list. Their routes are ordered, so swapping them isn't a new solution. The
+            # null route is last, and any number of them may run it.
+            if train_index > 0 and routes is sorted_routes[train_index - 1]:
+                previous_vars = route_vars[train_index - 1]
+                program += _route_index(train_vars) >= _route_index(previous_vars) + 1 - previous_vars[-1]
+
+        # A train's routes already exclude each other, so an edge only needs a constraint if several trains can use it.
+        for edge, edge_vars in vars_by_edge.items():
+            if len({train_index for train_index, route_var in edge_vars}) > 1:
+                program += pulp.lpSum([route_var for train_index, route_var in edge_vars]) <= 1
+
+        objective = [route[_VALUE] * route_var
+                for routes, train_vars in zip(sorted_routes, route_vars)
+                for route, route_var in zip(routes, train_vars)]
+
+        # With the Mail Contract, one selected route is chosen to carry the bonus. The objective rewards choosing the
+        # one with the most cities.
+        if city_bonus:
+            mail_vars = []
+            for train_index, (routes, train_vars) in enumerate(zip(sorted_routes, route_vars)):
+                for route_index, (route, route_var) in enumerate(zip(routes, train_vars)):
+                    if route[_CITIES]:
+                        mail_var = pulp.LpVariable("m_{}_{}".format(train_index, route_index), cat=pulp.LpBinary)
+                        program += mail_var <= route_var
+                        objective.append(city_bonus * route[_CITIES] * mail_var)
+                        mail_vars.append(mail_var)
+            program += pulp.lpSum(mail_vars) <= 1
+
+        program += pulp.lpSum(objective)
+
+        status = program.solve(pulp.PULP_CBC_CMD(msg=False, timeLimit=self.time_limit))
+        if program.sol_status not in (pulp.LpSolutionOptimal, pulp.LpSolutionIntegerFeasible):
+            # Running no routes at all is always possible, so this only happens when time_limit cut the solve short.
+            LOG.warning("No route set found within the time limit (%s). Running no routes.", pulp.LpStatus[status])
+            return [len(routes) - 1 for routes in sorted_routes]
+        if program.sol_status != pulp.LpSolutionOptimal:
+            LOG.warning("Ran out of time. The route set found may not be the best one.")
+
+        route_indexes = []
+        for train_vars in route_vars:
+            route_indexes.append(next(index for index, route_var in enumerate(train_vars) if route_var.varValue > 0.5))
+        return route_indexes
@@ -24,12 +24,13 @@ class PlacedTile(object):
     @staticmethod
     def place(name, cell, tile, orientation, stations=[], port_value=None, meat_value=None):
         paths = PlacedTile.get_paths(cell, tile, orientation)
-        return PlacedTile(name, cell, tile, stations, paths, port_value, meat_value)
+        return PlacedTile(name, cell, tile, stations, paths, port_value, meat_value, int(orientation))
 
-    def __init__(self, name, cell, tile, stations=[], paths={}, port_value=None, meat_value=None):
+    def __init__(self, name, cell, tile, stations=[], paths={}, port_value=None, meat_value=None, orientation=0):
         self.name = name or str(cell)
         self.cell = cell
         self.tile = tile
+        self.orientation = orientation
         self.capacity = tile.capacity
         self._stations = list(stations)
         self._paths = paths
@@ -102,6 +102,10 @@ class RemovedRailroad(Railroad):
         return True
 
 
+def detect_phase(railroads):
+    all_train_phases = [train.phase for railroad in railroads.values() for train in railroad.trains]
+    return max(all_train_phases) if all_train_phases else 1
+
 def load_from_csv(board, railroads_filepath):
     with open(railroads_filepath, newline='') as railroads_file:
         return load(board, csv.DictReader(railroads_file, fieldnames=FIELDNAMES, delimiter=';', skipinitialspace=True))
@@ -0,0 +1,233 @@
+import logging
+
+from routes1846 import boardstate, private_companies, railroads as railroads_module
+from routes1846.cell import CHICAGO_CELL
+from routes1846.find_best_routes import RouteCache, find_best_routes_all
+from routes1846.railroads import RAILROAD_HOME_CITIES, Railroad, Train
+from routes1846.solver import SolverPool
+from routes1846.tiles import get_tile
+
+LOG = logging.getLogger(__name__)
+
+# The actions an action log may contain. Each is a tuple of the action's name followed by the arguments to the
+# GameReplay method of the same name, except OPERATING_ROUND, which marks where to find the best routes.
+ACTIONS = ("place_tile", "place_chicago", "place_station", "place_chicago_station", "set_trains")
+OPERATING_ROUND = "operating_round"
+
+
+def _get_tile(tile_id):
+    tile = get_tile(tile_id)
+    if not tile:
+        raise ValueError("No tile with the tile ID {} was found.".format(tile_id))
+    return tile
+
+def _tiles_by_coord(board_state_rows):
+    tiles = {}
+    for tile_args in board_state_rows:
+        tile = _get_tile(tile_args["tile_id"])
+        tiles[str(CHICAGO_CELL) if tile.is_chicago else tile_args["coord"]] = (tile, 0 if tile.is_chicago else int(tile_args["orientation"]))
+    return tiles
+
+def _station_coords(railroad_args):
+    station_coords_str = railroad_args.get("stations") or ""
+    station_coords = {coord.strip() for coord in station_coords_str.split(",") if coord.strip()}
+    station_coords.add(RAILROAD_HOME_CITIES.get(railroad_args["name"]))
+    return station_coords
+
+def _chicago_exit(railroad_args):
+    chicago_station_exit_coord = str(railroad_args.get("chicago_station_exit_coord", "")).strip()
+    return int(chicago_station_exit_coord) if chicago_station_exit_coord else None
+
+def _is_removed(railroad_args):
+    trains_str = railroad_args.get("trains")
+    return bool(trains_str) and trains_str.lower() == "removed"
+
+def _private_companies_key(private_companies_rows, railroads_rows):
+    # An independent railroad without an owner only keeps its station before phase 3, so crossing into phase 3 changes
+    # what the private companies put on the board, even if their rows are the same.
+    trains = [Train.create(train_str) for railroad_args in railroads_rows if not _is_removed(railroad_args)
+            for train_str in (railroad_args.get("trains") or "").split(",") if train_str]
+    phase = max([train.phase for train in trains]) if trains else 1
+    return (tuple(tuple(sorted(company_args.items())) for company_args in private_companies_rows or ()), phase < 3)
+
+
+class GameReplay(object):
+    """
+    Steps through the states of a game, and finds every railroad's best routes in each. Rather than loading each state
+    onto a fresh Board, the replay keeps one Board and applies only what changed since the last state: new tiles,
+    upgrades, new stations and new trains. Its RouteCache then only searches again around the changed cells, and one
+    solver is used throughout.
+
+    States can be given as snapshots, in the rows boardstate.load(), railroads.load() and private_companies.load()
+    take, or as actions applied through place_tile(), place_station(), and so on. A snapshot which can't be reached by
+    placing tiles and stations (say, a station was removed, a railroad was removed, or a private company changed
+    hands) is loaded from scratch instead.
+
+    If no solver is passed in, the replay creates a SolverPool, and close() (or using it as a context manager) shuts it
+    down.
+    """
+
+    def __init__(self, solver=None):
+        self._owns_solver = solver is None
+        self._solver = solver or SolverPool()
+        self._route_cache = RouteCache()
+        self.board = None
+        self.railroads = {}
+
+        # What's been applied so far, to compare the next snapshot with.
+        self._tiles = {}
+        self._station_coords = {}
+        self._chicago_exits = {}
+        self._private_companies_key = None
+
+    def close(self):
+        if self._owns_solver:
+            self._solver.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def load(self, board_state_rows, railroads_rows, private_companies_rows=None):
+        """
+        Brings the replay to the given snapshot, applying only what changed since the last one where possible.
+        """
+        board_state_rows = [dict(tile_args) for tile_args in board_state_rows]
+        railroads_rows = [dict(railroad_args) for railroad_args in railroads_rows]
+        private_companies_rows = [dict(company_args) for company_args in private_companies_rows or ()]
+
+        tiles = _tiles_by_coord(board_state_rows)
+        private_companies_key = _private_companies_key(private_companies_rows, railroads_rows)
+        if self.board is None or not self._update(tiles, railroads_rows, private_companies_key):
+            self._reload(board_state_rows, railroads_rows, private_companies_rows)
+            self._tiles = tiles
+            self._private_companies_key = private_companies_key
+
+    def _reload(self, board_state_rows, railroads_rows, private_companies_rows):
+        LOG.debug("Loading the board from scratch.")
+        self.board = boardstate.load([dict(tile_args) for tile_args in board_state_rows])
+        self.railroads = railroads_module.load(self.board, railroads_rows)
+        private_companies.load(self.board, self.railroads, private_companies_rows)
+
+        self._station_coords = {railroad_args["name"]: _station_coords(railroad_args) for railroad_args in railroads_rows}
+        self._chicago_exits = {railroad_args["name"]: _chicago_exit(railroad_args) for railroad_args in railroads_rows
+                if str(CHICAGO_CELL) in self._station_coords[railroad_args["name"]]}
+
+    def _update(self, tiles, railroads_rows, private_companies_key):
+        """
+        Applies the difference between the current state and the given one. Returns False if it can't be applied, in
+        which case the board may be left partially updated, and should be reloaded.
+        """
+        if private_companies_key != self._private_companies_key or not set(self._tiles).issubset(tiles):
+            return False
+
+        railroads_args = {railroad_args["name"]: railroad_args for railroad_args in railroads_rows}
+        if not set(self.railroads).issubset(railroads_args) or len(railroads_args) != len(railroads_rows):
+            return False
+
+        for name, railroad in self.railroads.items():
+            railroad_args = railroads_args[name]
+            if railroad.is_removed != _is_removed(railroad_args) or \
+                    not self._station_coords[name].issubset(_station_coords(railroad_args)) or \
+                    self._chicago_exits.get(name, _chicago_exit(railroad_args)) != _chicago_exit(railroad_args):
+                return False
+
+        try:
+            changed_tiles = [(coord, tile, orientation) for coord, (tile, orientation) in tiles.items()
+                    if self._tiles.get(coord) != (tile, orientation)]
+            for coord, tile, orientation in sorted(changed_tiles, key=lambda changed_tile: changed_tile[1].phase):
+                if tile.is_chicago:
+                    self._place_chicago(tile)
+                else:
+                    self._place_tile(coord, tile, orientation)
+
+            for name, railroad_args in railroads_args.items():
+                if name not in self.railroads:
+                    self.railroads.update(railroads_module.load(self.board, [railroad_args]))
+                    self._station_coords[name] = _station_coords(railroad_args)
+                    if str(CHICAGO_CELL) in self._station_coords[name]:
+                        self._chicago_exits[name] = _chicago_exit(railroad_args)
+                    continue
+
+                if not self.railroads[name].is_removed:
+                    self.set_trains(name, railroad_args.get("trains"))
+
+                for coord in sorted(_station_coords(railroad_args) - self._station_coords[name]):
+                    if coord == str(CHICAGO_CELL):
+                        self.place_chicago_station(name, _chicago_exit(railroad_args))
+                    else:
+                        self.place_station(coord, name)
+        except ValueError as exc:
+            LOG.debug("Could not update the board in place: %s", exc)
+            return False
+
+        return True
+
+    def place_tile(self, coord, tile_id, orientation):
+        self._place_tile(coord, _get_tile(tile_id), int(orientation))
+
+    def _place_tile(self, coord, tile, orientation):
+        self.board.place_tile(coord, tile, orientation)
+        self._tiles[coord] = (tile, orientation)
+
+    def place_chicago(self, tile_id):
+        self._place_chicago(_get_tile(tile_id))
+
+    def _place_chicago(self, tile):
+        self.board.place_chicago(tile)
+        self._tiles[str(CHICAGO_CELL)] = (tile, 0)
+
+    def place_station(self, coord, railroad_name):
+        self.board.place_station(coord, self.railroads[railroad_name])
+        self._station_coords[railroad_name].add(coord)
+
+    def place_chicago_station(self, railroad_name, exit_side):
+        if exit_side is None:
+            raise ValueError("Chicago is listed as a station for {}, but no exit side was specified.".format(railroad_name))
+
+        self.board.place_chicago_station(self.railroads[railroad_name], int(exit_side))
+        self._station_coords[railroad_name].add(str(CHICAGO_CELL))
+        self._chicago_exits[railroad_name] = int(exit_side)
+
+    def set_trains(self, railroad_name, trains_str):
+        # Stations and tokens refer to the Railroad object itself, so it's updated rather than replaced.
+        self.railroads[railroad_name].trains = Railroad.create(railroad_name, trains_str).trains
+
+    def apply(self, action):
+        name, args = action[0], action[1:]
+        if name not in ACTIONS:
+            raise ValueError("Unrecognized action: {}".format(name))
+
+        getattr(self, name)(*args)
+
+    def find_best_routes(self):
+        """
+        Returns the best routes for every railroad in the current state, as find_best_routes_all() does.
+        """
+        return find_best_routes_all(self.board, self.railroads, route_cache=self._route_cache, solver=self._solver)
+
+
+def replay_snapshots(snapshots, solver=None):
+    """
+    Given (board state rows, railroads rows, private companies rows) for each operating round, yields every railroad's
+    best routes in each, as find_best_routes_all() returns them.
+    """
+    with GameReplay(solver) as replay:
+        for board_state_rows, railroads_rows, private_companies_rows in snapshots:
+            replay.load(board_state_rows, railroads_rows, private_companies_rows)
+            yield replay.find_best_routes()
+
+def replay_actions(board_state_rows, railroads_rows, private_companies_rows, actions, solver=None):
+    """
+    Starting from the given snapshot, applies each action in turn, and yields every railroad's best routes at each
+    OPERATING_ROUND action, as find_best_routes_all() returns them.
+    """
+    with GameReplay(solver) as replay:
+        replay.load(board_state_rows, railroads_rows, private_companies_rows)
+        for action in actions:
+            if action[0] == OPERATING_ROUND:
+                yield replay.find_best_routes()
+            else:
+                replay.apply(action)
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from routes1846.cell import Cell, board_cells
+from routes1846.railroads import detect_phase
+from routes1846.route import Route, RouteValuation
+
+LOG = logging.getLogger(__name__)
+
+# Bump this whenever the fingerprint contents or the cache file format change.
+_FORMAT_VERSION = 1
+
+
+def _board_state(board):
+    tiles, stations, tokens = [], [], []
+    for cell in board_cells():
+        space = board.get_space(cell)
+        if not space:
+            continue
+
+        tile = getattr(space, "tile", None)
+        if tile:
+            tiles.append((str(cell), tile.id, space.orientation))
+
+        exit_cells = {station: exit_cell for exit_cell, station in getattr(space, "exit_cell_to_station", {}).items()}
+        for station in space.stations if hasattr(space, "stations") else ():
+            exit_cell = exit_cells.get(station)
+            stations.append((str(cell), station.railroad.name, str(exit_cell) if exit_cell else ""))
+
+        if space.port_token:
+            tokens.append(("port", str(cell), space.port_token.railroad.name))
+        if space.meat_token:
+            tokens.append(("meat", str(cell), space.meat_token.railroad.name))
+
+    return sorted(tiles), sorted(stations), sorted(tokens)
+
+def _railroads_state(railroads):
+    return sorted([(
+            railroad.name,
+            railroad.is_removed,
+            railroad.has_mail_contract,
+            sorted([(train.collect, train.visit, train.phase) for train in railroad.trains]))
+        for railroad in railroads.values()])
+
+def board_fingerprint(board, railroads):
+    """
+    Returns a hash of everything about a fully loaded board and its railroads that can affect route finding. It doesn't
+    depend on the order in which tiles, stations or railroads were added.
+    """
+    tiles, stations, tokens = _board_state(board)
+    state = {
+        "version": _FORMAT_VERSION,
+        "tiles": tiles,
+        "stations": stations,
+        "tokens": tokens,
+        "railroads": _railroads_state(railroads),
+        "phase": detect_phase(railroads)
+    }
+    return hashlib.sha256(json.dumps(state, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ResultCache(object):
+    """
+    An on-disk, least-recently-used cache of the best route set found for a railroad, keyed by the board's fingerprint.
+    Each entry is a small JSON file. Reading an entry marks it as recently used by touching it.
+    """
+
+    def __init__(self, cache_dir, max_entries=1000):
+        if max_entries < 1:
+            raise ValueError("The result cache must be able to hold at least 1 entry. Got {}.".format(max_entries))
+
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _entry_path(self, board, railroads, railroad):
+        key = hashlib.sha256("{}:{}".format(board_fingerprint(board, railroads), railroad.name).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, "{}.json".format(key))
+
+    def get(self, board, railroads, railroad):
+        entry_path = self._entry_path(board, railroads, railroad)
+        try:
+            with open(entry_path) as entry_file:
+                entry = json.load(entry_file)
+            os.utime(entry_path)
+        except (OSError, ValueError):
+            return None
+
+        LOG.info("Found cached routes for %s.", railroad.name)
+        return self._load_route_set(board, railroads, railroad, entry["routes"])
+
+    def put(self, board, railroads, railroad, route_set):
+        entry = {"routes": [{
+                "train": str(run_route.train),
+                "path": [str(tile.cell) for tile in run_route],
+                "mail_contract": run_route.has_mail_contract
+            } for run_route in route_set]}
+
+        entry_file = tempfile.NamedTemporaryFile("w", dir=self.cache_dir, suffix=".tmp", delete=False)
+        with entry_file:
+            json.dump(entry, entry_file)
+        os.replace(entry_file.name, self._entry_path(board, railroads, railroad))
+
+        self._evict()
+
+    def _evict(self):
+        entry_paths = [os.path.join(self.cache_dir, filename) for filename in os.listdir(self.cache_dir) if filename.endswith(".json")]
+        if len(entry_paths) <= self.max_entries:
+            return
+
+        entry_paths.sort(key=lambda entry_path: os.path.getmtime(entry_path))
+        for entry_path in entry_paths[:len(entry_paths) - self.max_entries]:
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass
+
+    def _load_route_set(self, board, railroads, railroad, route_dicts):
+        phase = detect_phase(railroads)
+        valuation = RouteValuation(board, railroad, phase)
+        trains = {str(train): train for train in railroad.trains}
+
+        route_set = []
+        for route_dict in route_dicts:
+            route = Route.create([board.get_space(Cell.from_coord(coord)) for coord in route_dict["path"]])
+            run_route = route.run(board, trains[route_dict["train"]], railroad, phase, valuation)
+            if route_dict["mail_contract"]:
+                run_route.add_mail_contract()
+            route_set.append(run_route)
+        return route_set
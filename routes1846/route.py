@@ -1,8 +1,12 @@
-import heapq
-
 from routes1846.boardtile import EastTerminalCity, WestTerminalCity
+from routes1846.cell import edge_bit
+
+# The Mail Contract pays this much per city on one of the railroad's routes.
+MAIL_CONTRACT_CITY_BONUS = 10
 
 class Route(object):
+    __slots__ = ("_path", "_edges", "_key", "_hash")
+
     @staticmethod
     def create(path):
         return Route(tuple(path))
@@ -17,58 +21,63 @@ class Route(object):
 
     def __init__(self, path):
         self._path = tuple(path)
-        self._edges = [{path[k-1], path[k]} for k in range(1, len(path))]
+        self._edges = 0
+        for k in range(1, len(path)):
+            self._edges |= edge_bit(path[k-1].cell, path[k].cell)
+
+        # A route is identified by the edges it uses and the cells it ends on, regardless of direction. Two routes can
+        # cover the same cells with different edges, and the ends decide whether a route runs east to west.
+        ends = tuple(sorted([self._path[0].cell.id, self._path[-1].cell.id])) if self._path else ()
+        self._key = (self._edges, ends)
+        self._hash = hash(self._key)
 
     def merge(self, route):
         return Route.create(self._path + route._path)
 
-    def _best_cities(self, train, route_city_values, station_cities, include=None):
-        always_include = [(city, route_city_values[city]) for city in (include or [])]
-
-        # Find the station city to always include
-        always_include.append(max(station_cities.items(), key=lambda tile_and_value: tile_and_value[1]))
-
-        # Remove from consideration the station city and any cities that should always be included.
-        city_values = route_city_values.copy()
-        for to_include in always_include:
-            del city_values[to_include[0]]
-
-        # The route can collect cities only after accounting for anything marked always collect
-        collect = train.collect - len(always_include)
-        best_cities = dict(heapq.nlargest(collect, city_values.items(), key=lambda city_item: city_item[1]))
-
-        # Add back in the cities marked always collect
-        best_cities.update(dict(always_include))
-
-        return best_cities, sum(best_cities.values())
+    def value(self, board, train, railroad, phase, valuation=None):
+        valuation = valuation or RouteValuation(board, railroad, phase)
+        return valuation.best_cities(self, train)
 
-    def value(self, board, train, railroad, phase):
-        route_city_values = {tile: tile.value(railroad, phase) for tile in self if tile.is_city}
-        station_cells = {station.cell for station in board.stations(railroad.name)}
-        station_cities = {tile: value for tile, value in route_city_values.items() if tile.cell in station_cells}
+    def _find_best_cities(self, train, valuation):
+        city_values = [(tile, valuation.city_value(tile)) for tile in self.cities]
 
-        best_cities, route_value = self._best_cities(train, route_city_values, station_cities)
+        # The station city is always included. The rest are candidates, best first.
+        station_city = max([city_value for city_value in city_values if city_value[0].cell in valuation.station_cells],
+                key=lambda city_value: city_value[1])
+        candidates = sorted([city_value for city_value in city_values if city_value[0] != station_city[0]],
+                key=lambda city_value: city_value[1], reverse=True)
 
         # Check if the route runs from east to west.
-        terminals = [self._path[0], self._path[-1]]
+        terminals = (self._path[0], self._path[-1])
         east_to_west = all(isinstance(tile, (EastTerminalCity, WestTerminalCity)) for tile in terminals) and type(terminals[0]) != type(terminals[1])
-        if east_to_west:
-            # There is an east-west route. Confirm that a route including those
-            # terminal cities is the highest value route (including bonuses).
-            route_city_values_e2w = route_city_values.copy()
-            route_city_values_e2w.update({terminal: terminal.value(railroad, phase, east_to_west) for terminal in terminals})
-
-            best_cities_e2w, route_value_e2w = self._best_cities(train, route_city_values_e2w, station_cities, terminals)
+        if not east_to_west:
+            best_cities = dict(candidates[:max(train.collect - 1, 0)])
+            best_cities[station_city[0]] = station_city[1]
+            return best_cities
 
-            return best_cities_e2w if route_value_e2w >= route_value else best_cities
+        # There is an east-west route. Confirm that a route including those terminal cities (with their bonuses) is the
+        # highest value route. Both alternatives are picked from the same candidates in one pass: without the bonus,
+        # the best cities after the station; with it, the terminals and station, then the best of the rest.
+        best_cities, best_cities_e2w = [], []
+        for city_value in candidates:
+            if len(best_cities) < train.collect - 1:
+                best_cities.append(city_value)
+            if len(best_cities_e2w) < train.collect - 3 and city_value[0] not in terminals:
+                best_cities_e2w.append(city_value)
+            if len(best_cities) >= train.collect - 1 and len(best_cities_e2w) >= train.collect - 3:
+                break
+
+        best_cities.append(station_city)
+        best_cities_e2w.extend(valuation.east_to_west_values(terminals))
+        best_cities_e2w.append(station_city)
+
+        if sum(value for city, value in best_cities_e2w) >= sum(value for city, value in best_cities):
+            return dict(best_cities_e2w)
         else:
-            return best_cities
+            return dict(best_cities)
 
     def overlap(self, other):
-        for edge in self._edges:
-            if edge in other._edges:
-                return True
-        return False
+        return bool(self._edges & other._edges)
 
     def subroutes(self, start):
         if not self.contains_cell(start):
@@ -87,6 +96,10 @@ class Route(object):
     def cities(self):
         return [tile for tile in self._path if tile.is_city]
 
+    @property
+    def edges(self):
+        return self._edges
+
     def __iter__(self):
         return iter(self._path)
 
@@ -97,21 +110,57 @@ class Route(object):
         return len(self._path)
 
     def __hash__(self):
-        return hash(tuple(sorted([tile.cell for tile in self._path])))
+        return self._hash
 
     def __eq__(self, other):
-        return isinstance(other, Route) and set(other._path) == set(self._path)
+        return isinstance(other, Route) and self._key == other._key
 
     def __str__(self):
         return ", ".join([str(tile.cell) for tile in self])
 
-    def run(self, board, train, railroad, phase):
+    def run(self, board, train, railroad, phase, valuation=None):
         if railroad.is_removed:
             raise ValueError("Cannot run routes for a removed railroad: {}".format(railroad.name))
 
-        visited_cities = self.value(board, train, railroad, phase)
+        visited_cities = self.value(board, train, railroad, phase, valuation)
         return _RunRoute(self, visited_cities, train)
 
+class RouteValuation(object):
+    """
+    Values routes for a single railroad in a single phase. Create one per query and pass it to Route.run(), so that
+    city values and the railroad's station cells are only looked up once. A route's best cities only depend on how
+    many cities the train collects, so they're remembered per (route, collect), and reused across trains.
+    """
+
+    def __init__(self, board, railroad, phase):
+        self.railroad = railroad
+        self.phase = phase
+        self.station_cells = frozenset([station.cell for station in board.stations(railroad.name)])
+        self._city_values = {}
+        self._east_to_west_values = {}
+        self._best_cities_by_route = {}
+
+    def city_value(self, tile):
+        if tile not in self._city_values:
+            self._city_values[tile] = tile.value(self.railroad, self.phase)
+        return self._city_values[tile]
+
+    def east_to_west_values(self, terminals):
+        """
+        Returns [(terminal, value)] for both ends of an east-west route, including the east-west bonus. Computed once
+        per pair of terminals.
+        """
+        if terminals not in self._east_to_west_values:
+            self._east_to_west_values[terminals] = [(terminal, terminal.value(self.railroad, self.phase, True)) for terminal in terminals]
+        return self._east_to_west_values[terminals]
+
+    def best_cities(self, route, train):
+        # Routes compare by their edges and end cells, so the same route found in either direction shares an entry.
+        key = (route, train.collect)
+        if key not in self._best_cities_by_route:
+            self._best_cities_by_route[key] = route._find_best_cities(train, self)
+        return self._best_cities_by_route[key]
+
 class _RunRoute(object):
     def __init__(self, route, visited_city_values, train):
         self._route = route
@@ -119,18 +168,23 @@ class _RunRoute(object):
         self.city_values.update(visited_city_values)
         self.value = sum(self.city_values.values())
         self.train = train
+        self.edges = route.edges
 
         self._mail_contract = False
 
     def overlap(self, other):
-        return self._route.overlap(other._route)
+        return bool(self.edges & other.edges)
 
     def add_mail_contract(self):
         if not self._mail_contract:
-            self.value += len(self._route.cities) * 10
+            self.value += len(self._route.cities) * MAIL_CONTRACT_CITY_BONUS
 
             self._mail_contract = True
 
+    @property
+    def has_mail_contract(self):
+        return self._mail_contract
+
     @property
     def cities(self):
         return self._route.cities
@@ -0,0 +1,572 @@
+import array
+import logging
+import multiprocessing
+import os
+import queue
+import time
+
+from routes1846.route import MAIL_CONTRACT_CITY_BONUS
+
+LOG = logging.getLogger(__name__)
+
+# Routes cross process boundaries packed into EncodedRoutes. The search decodes them into (value, edge bitmask, index,
+# city count) tuples, where index is the route's position in its train's sorted route list. Only the indexes are sent
+# back, so the caller can map them back to routes.
+_VALUE = 0
+_EDGES = 1
+_INDEX = 2
+_CITIES = 3
+
+# How many times a worker uses its local copy of the best value before re-reading the shared one.
+_BEST_VALUE_REFRESH_INTERVAL = 64
+
+# How many nodes a worker searches between checks for idle workers to give work to.
+_STEAL_CHECK_INTERVAL = 256
+
+# How many routes a search with a deadline considers between checks of the time.
+_DEADLINE_CHECK_INTERVAL = 64
+
+# How long an idle worker waits for a task before checking whether the search is over.
+_IDLE_POLL_SECONDS = 0.01
+
+# The most problems a single batch can hold, since each needs its own best value slot.
+_MAX_PROBLEMS = 256
+
+# How many routes per train search_within() starts with. It doubles on each pass.
+_FIRST_TOP_K = 4
+
+# Set in each worker process by _init_worker()
+_shared_best_values = None
+_task_queue = None
+_pending_tasks = None
+_hungry_workers = None
+
+
+def _init_worker(shared_best_values, task_queue, pending_tasks, hungry_workers):
+    global _shared_best_values, _task_queue, _pending_tasks, _hungry_workers
+    _shared_best_values = shared_best_values
+    _task_queue = task_queue
+    _pending_tasks = pending_tasks
+    _hungry_workers = hungry_workers
+
+
+def encode_routes(sorted_routes):
+    """
+    Encodes a train's sorted routes, followed by the null route, which lets the train run nothing. The null route is
+    worth nothing and uses no edges, and its index is the number of routes.
+    """
+    return EncodedRoutes.encode(sorted_routes)
+
+def decode_problem(problem):
+    """
+    Decodes each train's EncodedRoutes in a problem. Identical trains share their EncodedRoutes, and still share the
+    decoded list.
+    """
+    decoded_routes = {}
+    for encoded_routes in problem.routes:
+        if id(encoded_routes) not in decoded_routes:
+            decoded_routes[id(encoded_routes)] = encoded_routes.decode()
+    return [decoded_routes[id(encoded_routes)] for encoded_routes in problem.routes]
+
+class Problem(object):
+    """
+    A single route set search: one EncodedRoutes per train, and whether the railroad has the Mail Contract. With it,
+    the value of a route set includes the bonus for the route with the most cities.
+    """
+
+    def __init__(self, routes, mail_contract=False):
+        self.routes = routes
+        self.mail_contract = mail_contract
+
+    @property
+    def city_bonus(self):
+        return MAIL_CONTRACT_CITY_BONUS if self.mail_contract else 0
+
+class EncodedRoutes(object):
+    """
+    A train's routes, packed into arrays so they pickle as a few byte strings. Each route's value and city count is
+    stored in an integer array, and its edge bitmask as a fixed-width little-endian chunk of a single byte string.
+    """
+
+    @staticmethod
+    def encode(sorted_routes):
+        width = (max([route.edges.bit_length() for route in sorted_routes], default=0) + 7) // 8
+        values = array.array('i', [route.value for route in sorted_routes] + [0])
+        city_counts = array.array('i', [len(route.cities) for route in sorted_routes] + [0])
+        edges = b"".join([route.edges.to_bytes(width, "little") for route in sorted_routes] + [bytes(width)])
+        return EncodedRoutes(values, city_counts, edges, width)
+
+    def __init__(self, values, city_counts, edges, width):
+        self.values = values
+        self.city_counts = city_counts
+        self.edges = edges
+        self.width = width
+
+    def decode(self):
+        width = self.width
+        return [(value, int.from_bytes(self.edges[index * width:(index + 1) * width], "little"), index, city_count)
+                for index, (value, city_count) in enumerate(zip(self.values, self.city_counts))]
+
+    def route(self, index):
+        """
+        Decodes only the route at index.
+        """
+        width = self.width
+        edges = int.from_bytes(self.edges[index * width:(index + 1) * width], "little")
+        return (self.values[index], edges, index, self.city_counts[index])
+
+    def __len__(self):
+        return len(self.values)
+
+class _BestValue(object):
+    """
+    A worker's view of the best route set value found by any worker, kept in a shared memory slot. Reads come from a
+    local copy which is refreshed periodically, and writes only ever raise the shared value. Nothing here takes a lock:
+    a stale or lost update only means pruning a little less, never pruning too much.
+    """
+
+    def __init__(self, shared_values, slot):
+        self._shared_values = shared_values
+        self._slot = slot
+        self._reads = 0
+        self._value = shared_values[slot]
+
+    @property
+    def value(self):
+        self._reads += 1
+        if self._reads >= _BEST_VALUE_REFRESH_INTERVAL:
+            self._reads = 0
+            self._value = max(self._value, self._shared_values[self._slot])
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        if value > self._value:
+            self._value = value
+        if value > self._shared_values[self._slot]:
+            self._shared_values[self._slot] = value
+
+def _donate(task_queue, pending_tasks, task):
+    with pending_tasks.get_lock():
+        pending_tasks.value += 1
+    task_queue.put(task)
+
+def _best_pair_value(routes, other_routes):
+    """
+    Returns the highest combined value of a route from each of the two sorted route lists which don't share an edge,
+    or -1 if no such pair exists.
+    """
+    best_value = -1
+    for route in routes:
+        if not other_routes or route[_VALUE] + other_routes[0][_VALUE] <= best_value:
+            break
+        for other_route in other_routes:
+            if route[_VALUE] + other_route[_VALUE] <= best_value:
+                break
+            if not route[_EDGES] & other_route[_EDGES]:
+                best_value = route[_VALUE] + other_route[_VALUE]
+                break
+    return best_value
+
+class _Bounds(object):
+    """
+    Upper bounds on what the trains left to choose routes for could add to a partial route set.
+
+    Each remaining train is limited to its best route which doesn't share an edge with the routes already selected.
+    The remaining trains are also paired off, and each pair is limited to the best value two of their routes can reach
+    without sharing an edge with each other, which is computed once per problem.
+
+    With the Mail Contract, the bonus is limited by the most cities on any route the remaining trains could still run.
+    """
+
+    def __init__(self, sorted_routes, city_bonus, best_pair_values=None):
+        self.sorted_routes = sorted_routes
+        self.city_bonus = city_bonus
+        # best_pair_values[level] holds the best pair value for the trains at level and level + 1. Pair values computed
+        # for more routes than sorted_routes holds still bound it, and may be passed in to save computing them.
+        if best_pair_values is None:
+            best_pair_values = [_best_pair_value(sorted_routes[level], sorted_routes[level + 1]) for level in range(len(sorted_routes) - 1)]
+        self.best_pair_values = best_pair_values
+
+        # max_cities_from[level][index] holds the most cities on any route of the train at level, from index onward.
+        self.max_cities_from = []
+        for routes in sorted_routes:
+            max_cities_from = [0] * (len(routes) + 1)
+            for index in range(len(routes) - 1, -1, -1):
+                max_cities_from[index] = max(max_cities_from[index + 1], routes[index][_CITIES])
+            self.max_cities_from.append(max_cities_from)
+
+    def first_free(self, level, edges, start):
+        """
+        Returns the index of the first route for the train at level, from start onward, which doesn't use any of the
+        given edges. Routes are sorted, so it's also the most valuable one. Returns the number of routes if none
+        qualify.
+        """
+        routes = self.sorted_routes[level]
+        index = start
+        while index < len(routes) and routes[index][_EDGES] & edges:
+            index += 1
+        return index
+
+    def remaining_value(self, level, free_indexes):
+        """
+        Returns the most the trains after level could add, or -1 if one of them has no route left. free_indexes holds
+        the first_free() index for each train after level, in order.
+        """
+        free_values = []
+        for offset, index in enumerate(free_indexes):
+            routes = self.sorted_routes[level + 1 + offset]
+            if index >= len(routes):
+                return -1
+            free_values.append(routes[index][_VALUE])
+
+        value = 0
+        for offset in range(0, len(free_values) - 1, 2):
+            pair_value = self.best_pair_values[level + 1 + offset]
+            if pair_value < 0:
+                return -1
+            value += min(pair_value, free_values[offset] + free_values[offset + 1])
+        if len(free_values) % 2:
+            value += free_values[-1]
+        return value
+
+    def max_cities(self, level, free_indexes):
+        """
+        Returns the most cities on any route the trains after level could still run, given their free_indexes.
+        """
+        return max([self.max_cities_from[level + 1 + offset][index] for offset, index in enumerate(free_indexes)], default=0)
+
+def _run_task(sorted_routes, bounds, best_value, task, task_queue=None, pending_tasks=None, hungry_workers=None,
+        deadline=None):
+    """
+    Searches the part of a problem's tree described by task, which is (problem ID, indexes of the routes already
+    selected for the leading trains, and the range of routes to try for the next train). Returns the best route set
+    found as a list of routes (or None), and whether the search finished before the deadline (if there is one).
+
+    When run by a worker, if another worker runs out of work, the unexplored half of the shallowest level still being
+    searched is split off and put back on the queue for it to take.
+    """
+    problem_id, prefix_indexes, start, end = task
+
+    last_level = len(sorted_routes) - 1
+    city_bonus = bounds.city_bonus
+    # The most the trains after each level could add, if they all ran their best route, and the most cities on any of
+    # their routes.
+    max_remaining_values = [sum([routes[0][_VALUE] for routes in sorted_routes[level + 1:]]) for level in range(len(sorted_routes))]
+    max_remaining_cities = [bounds.max_cities(level, [0] * (last_level - level)) for level in range(len(sorted_routes))]
+
+    # selected_cities holds the most cities on any selected route, for the Mail Contract.
+    selected_routes = [sorted_routes[level][index] for level, index in enumerate(prefix_indexes)]
+    selected_edges = [0]
+    selected_values = [0]
+    selected_cities = [0]
+    for route in selected_routes:
+        selected_edges.append(selected_edges[-1] | route[_EDGES])
+        selected_values.append(selected_values[-1] + route[_VALUE])
+        selected_cities.append(max(selected_cities[-1], route[_CITIES]))
+
+    # Trains which share a route list are identical, so each of their assignments is only tried in one order: a train's
+    # route must come after the route chosen for the identical train before it, unless both run the null route, which
+    # is last. same_train_start[level] is the first level of the run of identical trains level belongs to.
+    same_train_start = list(range(len(sorted_routes)))
+    for level in range(1, len(sorted_routes)):
+        if sorted_routes[level] is sorted_routes[level - 1]:
+            same_train_start[level] = same_train_start[level - 1]
+
+    first_level = len(prefix_indexes)
+    # Each frame is [next route index, end route index, free indexes] for the level at the same depth. The free indexes
+    # are the first_free() index of each later train, given the routes selected before this level. They only ever
+    # move forward as more routes are selected, so each level's scans pick up where the previous level's left off.
+    free_indexes = [bounds.first_free(level, selected_edges[-1], 0) for level in range(first_level + 1, last_level + 1)]
+    frames = [[max(start, bounds.first_free(first_level, selected_edges[-1], 0)), end, free_indexes]]
+    best_route_set = None
+    nodes = 0
+    scanned = 0
+    while frames:
+        level = first_level + len(frames) - 1
+        frame = frames[-1]
+        if frame[0] >= frame[1]:
+            frames.pop()
+            if frames:
+                selected_routes.pop()
+                selected_edges.pop()
+                selected_values.pop()
+                selected_cities.pop()
+            continue
+
+        route_index = frame[0]
+        route = sorted_routes[level][route_index]
+        frame[0] += 1
+
+        # Most routes are only looked at, not descended into, so the deadline is checked by routes scanned.
+        scanned += 1
+        if deadline and not scanned % _DEADLINE_CHECK_INTERVAL and time.time() >= deadline:
+            return best_route_set, False
+
+        if route[_EDGES] & selected_edges[-1]:
+            continue
+
+        # Already selected routes + the current route + the maximum possible value of the remaining train routes (and
+        # the largest possible Mail Contract bonus) must be more than the current best route set value. Routes are
+        # sorted by value, and the bonus only counts cities from this route onward, so if this one falls short, so
+        # will the rest of the routes at this level.
+        value = selected_values[-1] + route[_VALUE]
+        max_cities = max(selected_cities[-1], bounds.max_cities_from[level][route_index], max_remaining_cities[level])
+        if value + max_remaining_values[level] + city_bonus * max_cities <= best_value.value:
+            frame[0] = frame[1]
+            continue
+
+        cities = max(selected_cities[-1], route[_CITIES])
+        if level == last_level:
+            # A later route with less value could still win with a bigger bonus, so the level goes on. Without the
+            # Mail Contract, the check above ends it at the next route.
+            route_set_value = value + city_bonus * cities
+            if route_set_value > best_value.value:
+                best_route_set = selected_routes + [route]
+                best_value.value = route_set_value
+            continue
+
+        # The tighter bound depends on which edges this route uses, so falling short here only rules out this route.
+        edges = selected_edges[-1] | route[_EDGES]
+        free_indexes = []
+        for later_level, index in enumerate(frame[2], level + 1):
+            if same_train_start[later_level] <= level:
+                index = max(index, min(route_index + 1, len(sorted_routes[later_level]) - 1))
+            free_indexes.append(bounds.first_free(later_level, edges, index))
+        remaining_value = bounds.remaining_value(level, free_indexes)
+        if remaining_value < 0:
+            continue
+        max_cities = max(cities, bounds.max_cities(level, free_indexes))
+        if value + remaining_value + city_bonus * max_cities <= best_value.value:
+            continue
+
+        selected_routes.append(route)
+        selected_edges.append(edges)
+        selected_values.append(value)
+        selected_cities.append(cities)
+        frames.append([free_indexes[0], len(sorted_routes[level + 1]), free_indexes[1:]])
+
+        nodes += 1
+        if nodes % _STEAL_CHECK_INTERVAL:
+            continue
+
+        if hungry_workers and hungry_workers.value > 0:
+            for depth, donor_frame in enumerate(frames):
+                if donor_frame[0] < donor_frame[1]:
+                    split = (donor_frame[0] + donor_frame[1]) // 2
+                    donated_prefix = [route[_INDEX] for route in selected_routes[:first_level + depth]]
+                    _donate(task_queue, pending_tasks, (problem_id, donated_prefix, split, donor_frame[1]))
+                    donor_frame[1] = split
+                    break
+
+    return best_route_set, True
+
+def _find_best_route_sets_worker(problems):
+    """
+    Takes tasks off the shared queue until every task, including any split off by other workers, is done. Returns a
+    list of (problem ID, [route index per train]) for the best route set this worker found for each problem.
+    """
+    best_route_sets = {}
+    best_values = {}
+    decoded_problems = {}
+    bounds_by_problem = {}
+    hungry = False
+    while True:
+        try:
+            task = _task_queue.get(timeout=_IDLE_POLL_SECONDS)
+        except queue.Empty:
+            if _pending_tasks.value == 0:
+                break
+            if not hungry:
+                hungry = True
+                with _hungry_workers.get_lock():
+                    _hungry_workers.value += 1
+            continue
+
+        if hungry:
+            hungry = False
+            with _hungry_workers.get_lock():
+                _hungry_workers.value -= 1
+
+        # The task counts as done even if it fails, so the other workers still see the search end.
+        try:
+            problem_id = task[0]
+            if problem_id not in bounds_by_problem:
+                decoded_problems[problem_id] = decode_problem(problems[problem_id])
+                bounds_by_problem[problem_id] = _Bounds(decoded_problems[problem_id], problems[problem_id].city_bonus)
+            best_value = _BestValue(_shared_best_values, problem_id)
+            best_route_set = _run_task(decoded_problems[problem_id], bounds_by_problem[problem_id], best_value, task,
+                    _task_queue, _pending_tasks, _hungry_workers)[0]
+            if best_route_set:
+                value = _route_set_value(best_route_set, problems[problem_id].city_bonus)
+                if value > best_values.get(problem_id, -1):
+                    best_values[problem_id] = value
+                    best_route_sets[problem_id] = [route[_INDEX] for route in best_route_set]
+        finally:
+            with _pending_tasks.get_lock():
+                _pending_tasks.value -= 1
+
+    if hungry:
+        with _hungry_workers.get_lock():
+            _hungry_workers.value -= 1
+
+    return list(best_route_sets.items())
+
+def _route_set_value(route_set, city_bonus):
+    return sum(route[_VALUE] for route in route_set) + city_bonus * max(route[_CITIES] for route in route_set)
+
+def _greedy_route_set(sorted_routes):
+    """
+    Gives each train, in order, its best route which doesn't share an edge with those already chosen.
+    """
+    edges = 0
+    route_set = []
+    for routes in sorted_routes:
+        route = next(route for route in routes if not route[_EDGES] & edges)
+        route_set.append(route)
+        edges |= route[_EDGES]
+    return route_set
+
+def _limit_routes(sorted_routes, top_k):
+    """
+    Keeps only each train's top_k routes, plus the null route. Identical trains still share their route list.
+    """
+    limited_routes = {}
+    for routes in sorted_routes:
+        if id(routes) not in limited_routes:
+            limited_routes[id(routes)] = routes if len(routes) <= top_k + 1 else routes[:top_k] + [routes[-1]]
+    return [limited_routes[id(routes)] for routes in sorted_routes]
+
+def search_within(problem, deadline):
+    """
+    Searches a single problem in this process, giving up at deadline (as a time.time() value). Returns the best route
+    set found as [route index per train], its value, and an upper bound on the value of the best route set.
+
+    The search starts from a greedy route set, then repeatedly searches each train's top routes, doubling how many
+    it considers on each pass, until it has searched all of them or time runs out.
+
+    The upper bound is the one computed for the whole problem before searching. It doesn't tighten as better route
+    sets are found, so a search cut short reports the same bound however far it got. Only a finished search lowers it
+    to the value itself.
+    """
+    sorted_routes = decode_problem(problem)
+    city_bonus = problem.city_bonus
+
+    bounds = _Bounds(sorted_routes, city_bonus)
+    first_indexes = [0] * len(sorted_routes)
+    upper_bound = bounds.remaining_value(-1, first_indexes) + city_bonus * bounds.max_cities(-1, first_indexes)
+
+    best_route_set = _greedy_route_set(sorted_routes)
+    best_value = _BestValue([_route_set_value(best_route_set, city_bonus)], 0)
+
+    top_k = _FIRST_TOP_K
+    while True:
+        limited_routes = _limit_routes(sorted_routes, top_k)
+        limited_bounds = _Bounds(limited_routes, city_bonus, bounds.best_pair_values)
+        route_set, finished = _run_task(limited_routes, limited_bounds, best_value, (0, [], 0, len(limited_routes[0])),
+                deadline=deadline)
+        if route_set:
+            best_route_set = route_set
+        if not finished:
+            LOG.debug("Ran out of time searching the top %d routes per train.", top_k)
+            break
+
+        if all(len(limited) == len(routes) for limited, routes in zip(limited_routes, sorted_routes)):
+            upper_bound = _route_set_value(best_route_set, city_bonus)
+            break
+        top_k *= 2
+
+    value = _route_set_value(best_route_set, city_bonus)
+    return [route[_INDEX] for route in best_route_set], value, max(value, upper_bound)
+
+
+class SolverPool(object):
+    """
+    A long-lived set of worker processes for the route set search. Creating one is expensive, so callers answering
+    many queries should create it once and pass it to each find_best_routes() call as its solver. Call close() (or use
+    it as a context manager) when done. A SolverPool runs one solve() at a time, so don't share it between threads.
+
+    Every problem passed to solve() is searched at once. Each starts as a single task on a shared queue, and workers
+    which run out of tasks get more by having busy workers split off part of what they're searching.
+
+    If a worker fails, solve() shuts the pool down before raising the error, and the pool can't be used again.
+    """
+
+    def __init__(self, processes=None):
+        self.processes = processes or os.cpu_count()
+        # Each problem being solved gets a slot holding the best value found so far, which the workers share.
+        self._best_values = multiprocessing.RawArray('i', _MAX_PROBLEMS)
+        self._task_queue = multiprocessing.Queue()
+        self._pending_tasks = multiprocessing.Value('i', 0)
+        self._hungry_workers = multiprocessing.Value('i', 0)
+        self._pool = multiprocessing.Pool(processes=self.processes, initializer=_init_worker,
+                initargs=(self._best_values, self._task_queue, self._pending_tasks, self._hungry_workers))
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+    def terminate(self):
+        """
+        Stops the workers without waiting for them to finish what they're doing.
+        """
+        self._pool.terminate()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type:
+            self.terminate()
+        else:
+            self.close()
+
+    def solve(self, problems):
+        """
+        Given a list of Problems, returns a list of (problem index, [route index per train]), with one entry for each
+        problem which has any routes: the best route set found for it, counting the Mail Contract bonus. Identical
+        trains should be next to each other and share the same EncodedRoutes, so the search can skip assignments which
+        only differ by which of them runs which route.
+        """
+        best_route_sets = []
+        for batch_start in range(0, len(problems), _MAX_PROBLEMS):
+            batch = problems[batch_start:batch_start + _MAX_PROBLEMS]
+            for problem_id, route_indexes in self._solve_batch(batch):
+                best_route_sets.append((batch_start + problem_id, route_indexes))
+        return best_route_sets
+
+    def _solve_batch(self, problems):
+        self._hungry_workers.value = 0
+        self._pending_tasks.value = 0
+        for problem_id, problem in enumerate(problems):
+            self._best_values[problem_id] = 0
+            if problem.routes:
+                _donate(self._task_queue, self._pending_tasks, (problem_id, [], 0, len(problem.routes[0])))
+
+        if not self._pending_tasks.value:
+            return []
+
+        worker_promises = [self._pool.apply_async(_find_best_route_sets_worker, (problems, )) for k in range(self.processes)]
+
+        try:
+            worker_results = [promise.get() for promise in worker_promises]
+        except Exception:
+            # A failed search may leave tasks on the queue, which would be mixed into the next solve(). The pool
+            # can't be trusted after that, so it's shut down.
+            self.terminate()
+            raise
+
+        # Each worker reports the best route set it found for each problem it searched part of. Only the best of those
+        # is the problem's answer.
+        best_route_sets = {}
+        best_values = {}
+        for worker_result in worker_results:
+            for problem_id, route_indexes in worker_result:
+                problem = problems[problem_id]
+                route_set = [routes.route(index) for routes, index in zip(problem.routes, route_indexes)]
+                value = _route_set_value(route_set, problem.city_bonus)
+                if value > best_values.get(problem_id, -1):
+                    best_values[problem_id] = value
+                    best_route_sets[problem_id] = route_indexes
+        return sorted(best_route_sets.items())
@@ -14,6 +14,9 @@ setup(
     url="https://github.com/Auzzy/1846-routes",
     packages=['routes1846'],
     package_data={"routes1846": ["data/base-board.json", "data/tiles.json"]},
+    extras_require={
+        "ilp": ["pulp"]
+    },
     classifiers=[
         "Development Status :: 4 - Beta",
         "Operating System :: OS Independent",